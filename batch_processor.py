@@ -3,10 +3,30 @@ Credit Memo Auto-Generator - Batch PDF Processor
 Process multiple financial PDFs and creates separate outputs for each
 """
 
-import pdfplumber
+import asyncio
 import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 
+__all__ = ['PDFExtractor', 'BatchPDFProcessor']
+
+# Separator lines shared by console output and the per-PDF text files
+_EQ80 = "=" * 80
+_DASH80 = "─" * 80
+_HEADER_SEP = _EQ80 + "\n\n"
+_PAGE_SEP = _DASH80 + "\n"
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# PDFium is not thread-safe, even across documents; parallelism comes from the
+# process pool, and threads within a process take turns
+_PDFIUM_LOCK = threading.Lock()
+
+# The LLM memo generator lives in memo-generator/ and is imported on first use
+_MEMO_GENERATOR_DIR = Path(__file__).resolve().parent / 'memo-generator'
+
 
 class PDFExtractor:
     """Extract text from PDF files"""
@@ -21,6 +41,18 @@ class PDFExtractor:
         self.pdf_path = pdf_path
         self.text_content = []
         self.metadata = {}
+    
+    def reset(self, pdf_path=None):
+        """
+        Clear extracted state so the instance can be reused
+        
+        Args:
+            pdf_path (str, optional): New PDF file to extract from
+        """
+        if pdf_path is not None:
+            self.pdf_path = pdf_path
+        self.text_content = []
+        self.metadata = {}
         
     def extract_text(self):
         """
@@ -29,22 +61,33 @@ class PDFExtractor:
         Returns:
             dict: Dictionary containing extracted text and metadata
         """
+        # Imported on first use so loading this module stays cheap
+        import pypdfium2 as pdfium
+        
+        self.reset()
         try:
-            with pdfplumber.open(self.pdf_path) as pdf:
+            with _PDFIUM_LOCK, pdfium.PdfDocument(self.pdf_path) as pdf:
                 # Get metadata
                 self.metadata = {
-                    'total_pages': len(pdf.pages),
-                    'filename': os.path.basename(self.pdf_path)
+                    'total_pages': len(pdf),
+                    'filename': Path(self.pdf_path).name
                 }
                 
                 # Extract text from each page
-                for page_num, page in enumerate(pdf.pages, start=1):
-                    text = page.extract_text()
+                for page_num, page in enumerate(pdf, start=1):
+                    textpage = page.get_textpage()
+                    try:
+                        # PDFium ends lines with CRLF and returns whitespace
+                        # for blank pages rather than None
+                        text = textpage.get_text_range().replace("\r\n", "\n").strip()
+                    finally:
+                        textpage.close()
+                        page.close()
                     
                     if text:
                         self.text_content.append({
                             'page': page_num,
-                            'text': text.strip()
+                            'text': text
                         })
                 
                 return {
@@ -66,6 +109,16 @@ class PDFExtractor:
                 'error': f"Error extracting PDF: {str(e)}"
             }
     
+    def iter_page_texts(self):
+        """
+        Lazily iterate over the extracted text of each page
+        
+        Yields:
+            str: Text of one page, in page order
+        """
+        for page in self.text_content:
+            yield page['text']
+    
     def get_full_text(self):
         """
         Get all extracted text as a single string
@@ -73,7 +126,21 @@ class PDFExtractor:
         Returns:
             str: Complete text from all pages
         """
-        return "\n\n".join([page['text'] for page in self.text_content])
+        return "\n\n".join(self.iter_page_texts())
+    
+    def get_marked_text(self):
+        """
+        Get all extracted text with '--- PAGE N ---' markers
+        
+        This is the format the memo generator expects, so it can cite
+        source pages.
+        
+        Returns:
+            str: Complete text from all pages, each preceded by its marker
+        """
+        return "\n\n".join(
+            f"--- PAGE {page['page']} ---\n{page['text']}" for page in self.text_content
+        )
 
 
 class BatchPDFProcessor:
@@ -89,119 +156,293 @@ class BatchPDFProcessor:
         self.pdf_paths = pdf_paths
         self.results = []
         
-    def process_all(self, save_individual_files=True):
+    def process_all(self, save_individual_files=True, executor=None):
         """
         Process all PDFs and generate separate outputs
         
         Args:
             save_individual_files (bool): Save separate text file for each PDF
+            executor (ProcessPoolExecutor, optional): Long-lived pool to reuse
             
         Returns:
             list: List of processing results
         """
+        return asyncio.run(self.process_all_async(save_individual_files, executor))
+    
+    async def process_all_async(self, save_individual_files=True, executor=None):
+        """
+        Process all PDFs concurrently so one file's I/O overlaps another's parsing
+        
+        Args:
+            save_individual_files (bool): Save separate text file for each PDF
+            executor (ProcessPoolExecutor, optional): Long-lived pool to reuse,
+                e.g. one owned by a server; a pool sized to the batch is
+                created and shut down otherwise
+            
+        Returns:
+            list: List of processing results, in input order
+        """
         print(f"\n🚀 Starting batch processing of {len(self.pdf_paths)} PDFs...")
-        print("=" * 80)
+        print(_EQ80)
         
-        for idx, pdf_path in enumerate(self.pdf_paths, start=1):
-            print(f"\n📄 Processing {idx}/{len(self.pdf_paths)}: {os.path.basename(pdf_path)}")
-            print("─" * 80)
+        # Stat every path once up front so missing files never reach the pool
+        results = [None] * len(self.pdf_paths)
+        pending = []
+        for idx, pdf_path in enumerate(self.pdf_paths):
+            if os.path.exists(pdf_path):
+                pending.append(idx)
+            else:
+                results[idx] = _failed_result(pdf_path, 'File not found')
+                print(f"❌ Skipping {Path(pdf_path).name}: File not found")
+        
+        if pending:
+            # Only paths cross the process boundary; each worker opens its own PDF
+            max_workers = min(len(pending), os.cpu_count() or 1)
+            semaphore = asyncio.Semaphore(max_workers)
             
-            if not os.path.exists(pdf_path):
-                result = {
-                    'pdf_path': pdf_path,
-                    'filename': os.path.basename(pdf_path),
-                    'success': False,
-                    'error': 'File not found'
-                }
-                print(f"❌ Error: File not found")
-                self.results.append(result)
-                continue
+            if executor is None:
+                pool = ProcessPoolExecutor(max_workers=max_workers)
+            else:
+                pool = nullcontext(executor)
             
-            # Extract text from PDF
-            extractor = PDFExtractor(pdf_path)
-            extraction_result = extractor.extract_text()
+            with pool as pool_executor:
+                tasks = [
+                    asyncio.create_task(self._process_one_async(
+                        pool_executor, semaphore, self.pdf_paths[idx],
+                        save_individual_files, idx + 1, len(self.pdf_paths)
+                    ))
+                    for idx in pending
+                ]
+                outcomes = await asyncio.gather(*tasks)
             
-            if extraction_result['success']:
-                print(f"✅ Extracted {extraction_result['pages_with_text']} pages")
-                
-                result = {
-                    'pdf_path': pdf_path,
-                    'filename': extraction_result['metadata']['filename'],
-                    'success': True,
-                    'total_pages': extraction_result['total_pages'],
-                    'pages_with_text': extraction_result['pages_with_text'],
-                    'extractor': extractor,
-                    'text': extractor.get_full_text()
-                }
-                
-                # Save individual file if requested
-                if save_individual_files:
-                    output_file = pdf_path.replace('.pdf', '_extracted.txt')
-                    self._save_individual_file(extractor, extraction_result, output_file)
-                    result['output_file'] = output_file
-                    print(f"💾 Saved to: {os.path.basename(output_file)}")
-                
-                self.results.append(result)
-            else:
-                result = {
-                    'pdf_path': pdf_path,
-                    'filename': os.path.basename(pdf_path),
-                    'success': False,
-                    'error': extraction_result['error']
-                }
-                print(f"❌ Error: {extraction_result['error']}")
-                self.results.append(result)
+            for idx, outcome in zip(pending, outcomes):
+                results[idx] = outcome
         
+        sys.stdout.flush()
+        self.results.extend(results)
         return self.results
     
-    def _save_individual_file(self, extractor, metadata, output_file):
-        """Save extracted text to individual file"""
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(f"Extracted from: {metadata['metadata']['filename']}\n")
-            f.write(f"Total Pages: {metadata['total_pages']}\n")
-            f.write(f"Pages with Text: {metadata['pages_with_text']}\n")
-            f.write("=" * 80 + "\n\n")
+    async def _process_one_async(self, executor, semaphore, pdf_path, save_individual_files,
+                                 idx, total):
+        """Extract (and optionally save) one PDF in the worker pool"""
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(
+                    executor, _process_one, pdf_path, save_individual_files
+                )
+            except Exception as e:
+                # e.g. a crashed worker; report it like any other failed PDF
+                result = _failed_result(pdf_path, f"Error processing PDF: {str(e)}")
+        
+        # One write per PDF instead of a print per line
+        lines = [f"\n📄 Processed {idx}/{total}: {result['filename']}", _DASH80]
+        if result['success']:
+            lines.append(f"✅ Extracted {result['pages_with_text']} pages")
+            if 'output_file' in result:
+                lines.append(f"💾 Saved to: {Path(result['output_file']).name}")
+        else:
+            lines.append(f"❌ Error: {result['error']}")
+        sys.stdout.write("\n".join(lines) + "\n")
+        
+        return result
+    
+    def generate_memos(self, max_workers=8):
+        """
+        Generate a credit memo for every successfully processed PDF
+        
+        Args:
+            max_workers (int): Maximum number of concurrent LLM requests
+            
+        Returns:
+            list: Processing results, with 'memo' or 'memo_error' added
+        """
+        return asyncio.run(self.generate_memos_async(max_workers))
+    
+    async def generate_memos_async(self, max_workers=8):
+        """
+        Generate memos concurrently; LLM calls are network-bound
+        
+        Results only keep summary stats, so each PDF is parsed a second time
+        here (via get_text(result, marked=True)) to recover its page-marked
+        text; a PDF that can no longer be read gets a 'memo_error'.
+        
+        Args:
+            max_workers (int): Maximum number of concurrent LLM requests
+            
+        Returns:
+            list: Processing results, with 'memo' or 'memo_error' added
+        """
+        llm = _load_llm()
+        semaphore = asyncio.Semaphore(max_workers)
+        
+        try:
+            await asyncio.gather(*(
+                self._generate_memo_async(llm.generate_memo, semaphore, result)
+                for result in self.results if result['success']
+            ))
+        finally:
+            # Let background cache writes land and release the clients bound to
+            # this loop, so a later asyncio.run starts with fresh ones
+            await llm.aclose()
+        
+        sys.stdout.flush()
+        return self.results
+    
+    async def _generate_memo_async(self, generate_memo, semaphore, result):
+        """Re-extract one PDF with page markers and generate its memo"""
+        async with semaphore:
+            try:
+                text = await asyncio.to_thread(self.get_text, result, True)
+                if text is None:
+                    raise RuntimeError("Could not re-extract text from PDF")
+                result['memo'] = await generate_memo(text)
+                sys.stdout.write(f"📝 Memo generated: {result['filename']}\n")
+            except Exception as e:
+                result['memo_error'] = str(e)
+                sys.stdout.write(f"❌ Memo failed for {result['filename']}: {e}\n")
+    
+    @staticmethod
+    def get_text(result, marked=False):
+        """
+        Re-extract the full text of a processed PDF on demand
+        
+        Results only keep summary stats, so the text is read again from
+        the source PDF when a caller actually needs it.
+        
+        Args:
+            result (dict): A successful entry from process_all()
+            marked (bool): Prefix each page with a '--- PAGE n ---' marker,
+                the format the memo generator chunks on
             
-            # Write each page with clear separators
-            for page_data in extractor.text_content:
-                f.write(f"{'─' * 80}\n")
-                f.write(f"PAGE {page_data['page']}\n")
-                f.write(f"{'─' * 80}\n\n")
-                f.write(page_data['text'])
-                f.write("\n\n")
+        Returns:
+            str: Complete text from all pages, or None if extraction fails
+        """
+        extractor = PDFExtractor(result['pdf_path'])
+        if not extractor.extract_text()['success']:
+            return None
+        if marked:
+            return extractor.get_marked_text()
+        return extractor.get_full_text()
+    
+    @staticmethod
+    def _save_individual_file(extractor, metadata, output_file):
+        """Save extracted text to individual file"""
+        chunks = [
+            f"Extracted from: {metadata['metadata']['filename']}\n"
+            f"Total Pages: {metadata['total_pages']}\n"
+            f"Pages with Text: {metadata['pages_with_text']}\n",
+            _HEADER_SEP
+        ]
+        
+        # Write each page with clear separators
+        for page_data in extractor.text_content:
+            chunks.extend((
+                _PAGE_SEP,
+                f"PAGE {page_data['page']}\n",
+                _PAGE_SEP,
+                "\n",
+                page_data['text'],
+                "\n\n"
+            ))
+        
+        with open(output_file, 'w', encoding='utf-8', buffering=_WRITE_BUFFER_SIZE) as f:
+            f.writelines(chunks)
     
     def display_summary(self):
         """Display summary of batch processing"""
-        print("\n\n" + "=" * 80)
-        print("BATCH PROCESSING SUMMARY")
-        print("=" * 80)
-        
         successful = sum(1 for r in self.results if r['success'])
         failed = len(self.results) - successful
         
-        print(f"\n📊 Total PDFs: {len(self.results)}")
-        print(f"✅ Successful: {successful}")
-        print(f"❌ Failed: {failed}")
-        
-        print("\n" + "─" * 80)
-        print("Individual Results:")
-        print("─" * 80)
+        lines = [
+            "\n\n" + _EQ80,
+            "BATCH PROCESSING SUMMARY",
+            _EQ80,
+            f"\n📊 Total PDFs: {len(self.results)}",
+            f"✅ Successful: {successful}",
+            f"❌ Failed: {failed}",
+            "\n" + _DASH80,
+            "Individual Results:",
+            _DASH80
+        ]
         
         for idx, result in enumerate(self.results, start=1):
             status = "✅" if result['success'] else "❌"
-            print(f"{idx}. {status} {result['filename']}", end="")
-            
             if result['success']:
-                print(f" - {result['pages_with_text']} pages, {len(result['text'])} chars")
+                detail = f"{result['pages_with_text']} pages, {result['char_count']} chars"
             else:
-                print(f" - {result['error']}")
+                detail = result['error']
+            lines.append(f"{idx}. {status} {result['filename']} - {detail}")
+        
+        # Build the whole summary first and emit it in a single write
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+
+def _failed_result(pdf_path, error):
+    """Build the result entry for a PDF that could not be processed"""
+    return {
+        'pdf_path': pdf_path,
+        'filename': Path(pdf_path).name,
+        'success': False,
+        'error': error
+    }
+
+
+def _load_llm():
+    """Import the LLM memo generator, which needs the memo-generator dependencies"""
+    if str(_MEMO_GENERATOR_DIR) not in sys.path:
+        sys.path.insert(0, str(_MEMO_GENERATOR_DIR))
+    import llm
+    return llm
+
+
+def _process_one(pdf_path, save_individual_files):
+    """
+    Extract a single PDF and optionally save its text
+    
+    Runs in a worker process, so it only receives the path and returns
+    a plain, picklable dict.
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+        save_individual_files (bool): Save separate text file for the PDF
+        
+    Returns:
+        dict: Processing result for the PDF
+    """
+    # Extract text from PDF; a file removed since the up-front check is
+    # reported as not found by extract_text
+    extractor = PDFExtractor(pdf_path)
+    extraction_result = extractor.extract_text()
+    
+    if not extraction_result['success']:
+        return _failed_result(pdf_path, extraction_result['error'])
+    
+    result = {
+        'pdf_path': pdf_path,
+        'filename': extraction_result['metadata']['filename'],
+        'success': True,
+        'total_pages': extraction_result['total_pages'],
+        'pages_with_text': extraction_result['pages_with_text'],
+        'char_count': sum(len(text) for text in extractor.iter_page_texts())
+    }
+    
+    # Save individual file if requested
+    if save_individual_files:
+        pdf_file = Path(pdf_path)
+        output_file = str(pdf_file.with_name(pdf_file.stem + '_extracted.txt'))
+        BatchPDFProcessor._save_individual_file(extractor, extraction_result, output_file)
+        result['output_file'] = output_file
+    
+    return result
 
 
 def main():
     """Main function for batch PDF processing"""
     
     print("Credit Memo Auto-Generator - Batch PDF Processor")
-    print("=" * 80)
+    print(_EQ80)
     print("\nThis tool processes multiple PDFs and creates separate outputs for each.\n")
     
     # Get PDF file paths from user
@@ -216,9 +457,9 @@ def main():
         if not path or path.lower() == 'done':
             break
         
-        if os.path.exists(path) and path.lower().endswith('.pdf'):
+        if os.path.splitext(path)[1].lower() == '.pdf' and os.path.exists(path):
             pdf_paths.append(path)
-            print(f"  ✅ Added: {os.path.basename(path)}")
+            print(f"  ✅ Added: {Path(path).name}")
         else:
             print(f"  ⚠️ Skipped: Invalid path or not a PDF file")
     
@@ -239,9 +480,9 @@ def main():
     # Display summary
     processor.display_summary()
     
-    print("\n" + "=" * 80)
+    print("\n" + _EQ80)
     print("✅ Batch processing complete!")
-    print("=" * 80)
+    print(_EQ80)
 
 
 if __name__ == "__main__":
@@ -1,22 +1,42 @@
 import os
+import re
+import math
+import asyncio
+import hashlib
+import importlib.util
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from itertools import chain, zip_longest
 from dotenv import load_dotenv
-import instructor
 from pydantic import BaseModel
-from groq import Groq
-from typing import Any
-from models import Memo
-
-#replace this comment
-
-def generate_memo(ocr_text: str) -> Memo:
-    """Generate memo from OCR text"""
-    return client.messages.create(
-        model="llama-3.1-8b-instant",  # Or llama-3.1-8b
-        response_model=Memo,
-        messages=[
-            {
-                "role": "system",
-                "content": """You are a senior credit analyst.
+from typing import Any, AsyncIterator, List, Optional, Type
+from models import BatchMemoResponse, Memo
+
+load_dotenv()
+
+# The Groq SDK retries 429s and 5xx with exponential backoff (honouring
+# Retry-After), which keeps concurrent batch callers from stampeding the API.
+GROQ_MAX_RETRIES = 5
+
+# groq/instructor pull in httpx and friends; build the client on first use so
+# importing this module (and cold starts) stay cheap. Its httpx pool is bound
+# to the event loop that first used it; see aclose().
+_groq = None
+_client = None
+_stream_client = None
+
+# Upper bound on completion length; a full memo is well under this
+MAX_TOKENS = 2048
+
+# Settings shared by every completion request; copied shallowly per call
+_REQUEST_TEMPLATE = {
+    "model": "llama-3.1-8b-instant",  # Or llama-3.1-8b
+    "temperature": 0.1,
+    "max_retries": 3,  # Instructor auto-retries if invalid
+}
+
+_SYSTEM_PROMPT = """You are a senior credit analyst.
 
 You read messy OCR text from financial documents and produce a structured memo.
 
@@ -25,19 +45,517 @@ Rules:
 - source_pages: use page numbers from markers like 'PAGE 1'
 - If data missing, omit the metric or set confidence to "incomplete_data"
 - Executive summary: 3-5 short bullets in plain English.
-- Top risks: 3 most important credit risks.
+- Top risks: 3 most important credit risks."""
+
+# JSON mode plus the schema instructor appends to the system prompt already
+# pin the output format, so the prompts don't spend tokens asking for JSON
+_USER_PREFIX = "OCR text from financial document:\n\n"
+
+# Several short documents can share one request, amortising the system prompt.
+# Budgets are in characters of preprocessed OCR text (~4 per token) and keep a
+# batch far inside llama-3.1-8b-instant's 128k-token context window
+BATCH_SIZE = 5
+BATCH_DOC_MAX_CHARS = 8_000
+BATCH_MAX_CHARS = 24_000
+_BATCH_SYSTEM_PROMPT = _SYSTEM_PROMPT + """
+
+You will receive several documents, each starting with '=== DOCUMENT N ==='.
+Return {"memos": [...]} with exactly one memo per document, in the same order."""
+_BATCH_USER_PREFIX = "OCR text from financial documents:\n\n"
+
+# Memo cache: in-memory LRU in front of an on-disk store keyed by a hash of the
+# model, prompt/schema version and OCR text.
+# Set MEMO_CACHE_DIR to an empty string to disable the disk tier.
+MEMO_CACHE_DIR = os.getenv("MEMO_CACHE_DIR", os.path.join(".cache", "memos"))
+# Bump whenever the prompts or the Memo schema change so stale memos are not served
+_CACHE_VERSION = "1"
+_MEMORY_CACHE_SIZE = 128
+_memory_cache: "OrderedDict[str, Memo]" = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+# Optional shared tier for multi-worker/multi-host deployments: set REDIS_URL
+# (needs `pip install redis`). It is best effort, so an unreachable server only
+# costs REDIS_TIMEOUT seconds per lookup rather than stalling requests.
+REDIS_URL = os.getenv("REDIS_URL")
+MEMO_CACHE_TTL = int(os.getenv("MEMO_CACHE_TTL", "86400"))
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))
+if REDIS_URL and importlib.util.find_spec("redis") is None:
+    # Fail at startup rather than on every request
+    raise RuntimeError("REDIS_URL is set but the redis package is not installed (pip install redis)")
+_redis = None
+_pending_cache_writes = set()
+
+# Optional semantic tier, consulted after an exact miss (see semantic_cache.py)
+SEMANTIC_CACHE_ENABLED = os.getenv("MEMO_SEMANTIC_CACHE", "") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("MEMO_SEMANTIC_THRESHOLD", "0.87"))
+_SEMANTIC_CACHE_SIZE = 1024
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+# Long documents are split on page markers and sent as concurrent requests
+PAGES_PER_CHUNK = 10
+MAX_CONCURRENT_CALLS = 5
+_PAGE_MARKER = re.compile(r"(?=--- PAGE )")
+_SEVERITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+# OCR preprocessing: drop repeated header/footer lines, keep the pages with the
+# most financial content, and squeeze whitespace before anything is billed
+MAX_PAGES = 20
+_MIN_BOILERPLATE_LEN = 20
+# A header/footer is a line in the top or bottom _EDGE_LINES of a page body that
+# recurs there on at least max(_BOILERPLATE_MIN_PAGES, share * pages) pages.
+# Kept at one line: tables often end a page, so the row above a footer repeats too
+_EDGE_LINES = 1
+_BOILERPLATE_MIN_PAGES = 3
+_BOILERPLATE_PAGE_SHARE = 0.5
+_FINANCIAL_TERMS = re.compile(
+    r"\b(?:revenue|ebitda|profit|loss|debt|margin)\b|Rs\.|₹|\b\d{4,}\b", re.IGNORECASE
+)
+_HORIZONTAL_SPACE = re.compile(r"[ \t\f\v]+")
+
+
+def _get_groq():
+    """Return the raw AsyncGroq client, creating it on first use"""
+    global _groq
+    if _groq is None:
+        from groq import AsyncGroq
+        _groq = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), max_retries=GROQ_MAX_RETRIES)
+    return _groq
+
+
+def _get_client():
+    """Return the instructor-wrapped Groq client, creating it on first use"""
+    global _client
+    if _client is None:
+        import instructor
+        # JSON mode makes Groq constrain decoding to a JSON object, so responses
+        # don't arrive wrapped in markdown fences and fail validation
+        _client = instructor.from_groq(_get_groq(), mode=instructor.Mode.JSON)
+    return _client
+
+
+def _get_stream_client():
+    """Return the instructor-wrapped Groq client used for streaming"""
+    global _stream_client
+    if _stream_client is None:
+        import instructor
+        # Groq rejects response_format=json_object together with stream=True, so
+        # partial streaming uses MD_JSON, which only asks for JSON in the prompt
+        # and tolerates fenced output
+        _stream_client = instructor.from_groq(_get_groq(), mode=instructor.Mode.MD_JSON)
+    return _stream_client
+
+
+def __getattr__(name: str) -> Any:
+    # Keep `llm.client` working for existing callers (PEP 562)
+    if name == "client":
+        return _get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _cache_key(ocr_text: str) -> str:
+    """Hash of the model, prompt/schema version and OCR text addressing a cached memo"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{_REQUEST_TEMPLATE['model']}\0{_CACHE_VERSION}\0".encode("utf-8"))
+    digest.update(ocr_text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _remember(key: str, memo: Memo) -> None:
+    """Store memo in the in-memory LRU, evicting the oldest entry"""
+    with _memory_cache_lock:
+        _memory_cache[key] = memo
+        _memory_cache.move_to_end(key)
+        if len(_memory_cache) > _MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def _get_semantic_cache():
+    """Return the shared semantic cache, or None when it is disabled"""
+    global _semantic_cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            from semantic_cache import SemanticCache
+            _semantic_cache = SemanticCache(_SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
+    return _semantic_cache
+
+
+def _load_cached_memo(key: str) -> Optional[Memo]:
+    """Return the cached memo for key from memory or disk, if any"""
+    with _memory_cache_lock:
+        memo = _memory_cache.get(key)
+        if memo is not None:
+            _memory_cache.move_to_end(key)
+            return memo
+
+    if not MEMO_CACHE_DIR:
+        return None
+    try:
+        with open(os.path.join(MEMO_CACHE_DIR, f"{key}.json"), encoding="utf-8") as f:
+            memo = Memo.model_validate_json(f.read())
+    except (OSError, ValueError):
+        # Missing or unreadable/stale entries are treated as a miss
+        return None
+
+    _remember(key, memo)
+    return memo
+
+
+def _store_cached_memo(key: str, memo: Memo) -> None:
+    """Store memo in memory and, best effort, atomically on disk"""
+    _remember(key, memo)
+
+    if not MEMO_CACHE_DIR:
+        return
+    tmp_path = None
+    try:
+        os.makedirs(MEMO_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=MEMO_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(memo.model_dump_json())
+        os.replace(tmp_path, os.path.join(MEMO_CACHE_DIR, f"{key}.json"))
+    except OSError:
+        # A failed cache write must not fail memo generation
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def _get_redis():
+    """Return the shared Redis client, or None when REDIS_URL is unset"""
+    global _redis
+    if REDIS_URL and _redis is None:
+        import redis.asyncio as redis
+        _redis = redis.Redis.from_url(
+            REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT
+        )
+    return _redis
+
+
+async def _cache_get(key: str) -> Optional[Memo]:
+    """Look key up in memory, on disk, then in Redis when configured"""
+    # Disk reads would block the event loop
+    memo = await asyncio.to_thread(_load_cached_memo, key)
+    if memo is not None:
+        return memo
+    redis_client = _get_redis()
+    if redis_client is None:
+        return None
+
+    from redis.exceptions import RedisError
+    try:
+        raw = await redis_client.get(f"memo:{key}")
+        if raw is None:
+            return None
+        memo = Memo.model_validate_json(raw)
+    except (RedisError, ValueError):
+        # An unreachable or stale shared cache is treated as a miss
+        return None
+
+    _remember(key, memo)
+    return memo
+
+
+async def _cache_put(key: str, memo: Memo) -> None:
+    """Store memo locally and, when configured, in Redis"""
+    await asyncio.to_thread(_store_cached_memo, key, memo)
+    redis_client = _get_redis()
+    if redis_client is None:
+        return
+
+    from redis.exceptions import RedisError
+    try:
+        await redis_client.setex(f"memo:{key}", MEMO_CACHE_TTL, memo.model_dump_json())
+    except RedisError:
+        # Best effort, like the disk tier
+        pass
+
+
+def _cache_put_later(key: str, memo: Memo) -> None:
+    """Cache memo in memory now and persist it in the background"""
+    # The caller already has the memo; only the disk/Redis writes are deferred
+    _remember(key, memo)
+    task = asyncio.get_running_loop().create_task(_cache_put(key, memo))
+    _pending_cache_writes.add(task)
+    task.add_done_callback(_pending_cache_writes.discard)
+
+
+async def flush_cache_writes() -> None:
+    """Wait for background cache writes, e.g. before the event loop shuts down"""
+    if _pending_cache_writes:
+        await asyncio.gather(*_pending_cache_writes)
+
+
+async def aclose() -> None:
+    """Flush cache writes and close the Groq and Redis clients
+
+    Both hold connections bound to the running event loop, so call this before
+    that loop ends (e.g. at the end of each asyncio.run); the clients are
+    rebuilt on next use.
+    """
+    global _groq, _client, _stream_client, _redis
+    await flush_cache_writes()
+    groq_client, redis_client = _groq, _redis
+    _groq = _client = _stream_client = _redis = None
+    if groq_client is not None:
+        await groq_client.close()
+    if redis_client is not None:
+        await redis_client.aclose()
 
-Output valid JSON matching the schema exactly."""
-            },
-            {
-                "role": "user",
-                "content": f"""OCR text from financial document:
 
-{ocr_text}
+async def generate_memo(ocr_text: str) -> Memo:
+    """Generate memo from OCR text, one LLM call per chunk of pages"""
+    return await _generate(_preprocess(ocr_text))
 
-Respond with JSON only."""
-            }
-        ],
-        temperature=0.1,
-        max_retries=3  # Instructor auto-retries if invalid
+
+async def generate_memos(ocr_texts: List[str]) -> List[Memo]:
+    """Generate one memo per document, packing short documents into shared LLM calls"""
+    texts = [_preprocess(text) for text in ocr_texts]
+    memos: List[Optional[Memo]] = [None] * len(texts)
+
+    # Only short, uncached documents are worth batching; the rest go the usual way
+    batchable = []
+    for idx, text in enumerate(texts):
+        if len(text) <= BATCH_DOC_MAX_CHARS and len(_split_by_page_markers(text)) == 1:
+            memos[idx] = await _cache_get(_cache_key(text))
+            if memos[idx] is None:
+                batchable.append(idx)
+
+    # Greedily fill batches in input order up to BATCH_SIZE documents and
+    # BATCH_MAX_CHARS characters
+    batches: List[List[int]] = []
+    batch_chars = 0
+    for idx in batchable:
+        if (not batches or len(batches[-1]) == BATCH_SIZE
+                or batch_chars + len(texts[idx]) > BATCH_MAX_CHARS):
+            batches.append([])
+            batch_chars = 0
+        batches[-1].append(idx)
+        batch_chars += len(texts[idx])
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+
+    async def run_batch(indices: List[int]) -> None:
+        async with semaphore:
+            batch_memos = await _memos_for_batch([texts[idx] for idx in indices])
+        for idx, memo in zip(indices, batch_memos):
+            memos[idx] = memo
+
+    async def run_single(idx: int) -> None:
+        memos[idx] = await _generate(texts[idx])
+
+    await asyncio.gather(
+        *(run_batch(indices) for indices in batches),
+        *(run_single(idx) for idx in range(len(texts)) if memos[idx] is None and idx not in batchable),
+    )
+    return memos
+
+
+async def _generate(ocr_text: str) -> Memo:
+    """Generate memo from already preprocessed OCR text"""
+    chunks = _split_by_page_markers(ocr_text)
+    if len(chunks) == 1:
+        return await _memo_for_chunk(chunks[0])
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+
+    async def bounded(chunk: str) -> Memo:
+        async with semaphore:
+            return await _memo_for_chunk(chunk)
+
+    memos = await asyncio.gather(*(bounded(chunk) for chunk in chunks))
+    return _merge_memos(memos)
+
+
+async def _memos_for_batch(texts: List[str]) -> List[Memo]:
+    """Generate memos for several short documents in a single LLM call"""
+    if len(texts) == 1:
+        return [await _memo_for_chunk(texts[0])]
+
+    documents = "\n\n".join(
+        f"=== DOCUMENT {idx} ===\n{text}" for idx, text in enumerate(texts, start=1)
+    )
+    response = await _get_client().messages.create(**_llm_request(
+        _BATCH_USER_PREFIX + documents,
+        response_model=BatchMemoResponse,
+        system_prompt=_BATCH_SYSTEM_PROMPT,
+        # Room for a full memo per document, so none is truncated
+        max_tokens=MAX_TOKENS * len(texts),
+    ))
+
+    if len(response.memos) != len(texts):
+        # The model lost track of document boundaries; fall back to one call each
+        return list(await asyncio.gather(*(_memo_for_chunk(text) for text in texts)))
+
+    for text, memo in zip(texts, response.memos):
+        _cache_put_later(_cache_key(text), memo)
+    return response.memos
+
+
+async def _memo_for_chunk(ocr_text: str) -> Memo:
+    """Generate memo for one chunk, reusing cached results for identical input"""
+    key = _cache_key(ocr_text)
+    memo = await _cache_get(key)
+    if memo is not None:
+        return memo
+
+    semantic_cache = _get_semantic_cache()
+    if semantic_cache is not None:
+        # Embedding is CPU-heavy, so keep it off the event loop
+        embedding = await asyncio.to_thread(semantic_cache.embed, ocr_text)
+        _, memo = semantic_cache.lookup(embedding)
+        if memo is not None:
+            _remember(key, memo)
+            return memo
+
+    memo = await _call_llm(ocr_text)
+    _cache_put_later(key, memo)
+    if semantic_cache is not None:
+        semantic_cache.add(key, embedding, memo)
+    return memo
+
+
+def _split_pages(ocr_text: str) -> List[str]:
+    """Split OCR text into '--- PAGE N ---' sections"""
+    pages = [page for page in _PAGE_MARKER.split(ocr_text) if page]
+    if len(pages) > 1 and not pages[0].startswith("--- PAGE "):
+        # Keep any preamble before the first marker with page 1
+        preamble = pages.pop(0)
+        pages[0] = preamble + pages[0]
+    return pages
+
+
+def _split_by_page_markers(ocr_text: str, pages_per_chunk: int = PAGES_PER_CHUNK) -> List[str]:
+    """Split OCR text into chunks of pages_per_chunk '--- PAGE N ---' sections"""
+    pages = _split_pages(ocr_text)
+    if len(pages) <= pages_per_chunk:
+        return [ocr_text]
+    return [
+        "".join(pages[i:i + pages_per_chunk])
+        for i in range(0, len(pages), pages_per_chunk)
+    ]
+
+
+def _page_edges(lines: List[str]):
+    """Index ranges of the top and bottom _EDGE_LINES of a page, after its marker"""
+    start = 1 if lines and lines[0].startswith("--- PAGE ") else 0
+    end = len(lines)
+    top = range(start, min(start + _EDGE_LINES, end))
+    bottom = range(max(start, end - _EDGE_LINES), end)
+    return top, bottom
+
+
+def _preprocess(ocr_text: str) -> str:
+    """Strip running headers/footers and keep the MAX_PAGES most financial pages"""
+    split_pages = []
+    for page in _split_pages(ocr_text):
+        lines = (line.strip() for line in _HORIZONTAL_SPACE.sub(" ", page).splitlines())
+        split_pages.append([line for line in lines if line])
+
+    # Only lines that sit at the same edge of many pages count as boilerplate;
+    # labels repeated inside page bodies ('Revenue from operations') are content
+    top_counts, bottom_counts = Counter(), Counter()
+    for lines in split_pages:
+        top, bottom = _page_edges(lines)
+        top_counts.update({lines[i] for i in top})
+        bottom_counts.update({lines[i] for i in bottom})
+    min_pages = max(
+        _BOILERPLATE_MIN_PAGES, math.ceil(len(split_pages) * _BOILERPLATE_PAGE_SHARE)
     )
+    headers = {
+        line for line, count in top_counts.items()
+        if count >= min_pages and len(line) >= _MIN_BOILERPLATE_LEN
+    }
+    footers = {
+        line for line, count in bottom_counts.items()
+        if count >= min_pages and len(line) >= _MIN_BOILERPLATE_LEN
+    }
+
+    pages = []
+    for lines in split_pages:
+        top, bottom = _page_edges(lines)
+        drop = {i for i in top if lines[i] in headers}
+        drop.update(i for i in bottom if lines[i] in footers)
+        pages.append("\n".join(line for i, line in enumerate(lines) if i not in drop))
+
+    if len(pages) > MAX_PAGES:
+        ranked = sorted(
+            range(len(pages)),
+            key=lambda i: len(_FINANCIAL_TERMS.findall(pages[i])),
+            reverse=True,
+        )
+        pages = [pages[i] for i in sorted(ranked[:MAX_PAGES])]
+
+    return "\n".join(pages)
+
+
+def _merge_memos(memos: List[Memo]) -> Memo:
+    """Combine per-chunk memos into a single memo"""
+    # Interleave bullets so every chunk is represented in the summary
+    summary = []
+    for bullet in chain.from_iterable(zip_longest(*(m.executive_summary for m in memos))):
+        if bullet is not None and bullet not in summary:
+            summary.append(bullet)
+
+    metrics = {}
+    for metric in chain.from_iterable(m.key_metrics for m in memos):
+        metrics.setdefault((metric.name.lower(), metric.period), metric)
+
+    risks = {}
+    for risk in chain.from_iterable(m.top_risks for m in memos):
+        risks.setdefault(risk.title.lower(), risk)
+    top_risks = sorted(risks.values(), key=lambda r: _SEVERITY_RANK.get(r.severity.lower(), 3))
+
+    return Memo(
+        executive_summary=summary[:5],
+        key_metrics=list(metrics.values()),
+        top_risks=top_risks[:3],
+    )
+
+
+def _llm_request(
+    user_content: str,
+    response_model: Type[BaseModel] = Memo,
+    system_prompt: str = _SYSTEM_PROMPT,
+    max_tokens: int = MAX_TOKENS,
+) -> dict:
+    """Keyword arguments for a completion request"""
+    request = {**_REQUEST_TEMPLATE, "response_model": response_model, "max_tokens": max_tokens}
+    # Fresh message dicts per call: instructor's JSON mode appends the schema
+    # to the system message in place
+    request["messages"] = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+    return request
+
+
+async def _call_llm(ocr_text: str) -> Memo:
+    """Ask the LLM for a memo"""
+    return await _get_client().messages.create(**_llm_request(_USER_PREFIX + ocr_text))
+
+
+async def stream_memo(ocr_text: str) -> AsyncIterator[BaseModel]:
+    """Yield progressively more complete memos as the LLM generates them"""
+    ocr_text = _preprocess(ocr_text)
+    if len(_split_by_page_markers(ocr_text)) > 1:
+        # Per-chunk memos are only meaningful once merged
+        yield await _generate(ocr_text)
+        return
+
+    key = _cache_key(ocr_text)
+    memo = await _cache_get(key)
+    if memo is not None:
+        yield memo
+        return
+
+    partial = None
+    request = _llm_request(_USER_PREFIX + ocr_text)
+    async for partial in _get_stream_client().messages.create_partial(**request):
+        yield partial
+
+    if partial is not None:
+        # The last partial is the complete response; validate before caching
+        memo = Memo.model_validate(partial.model_dump())
+        _cache_put_later(key, memo)
@@ -1,22 +1,70 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel as PydanticBaseModel
-from models import Memo
-from llm import generate_memo
+from contextlib import asynccontextmanager
+from typing import List
+from models import BatchMemoResponse, Memo
+from llm import aclose, generate_memo, generate_memos, stream_memo
+import json
 import os
 
-app = FastAPI(title="Credit Memo Generator")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Memo cache writes run after responses are sent; finish them, then close
+    # the Groq/Redis connections before the event loop exits
+    await aclose()
+
+app = FastAPI(title="Credit Memo Generator", lifespan=lifespan)
 
 class OCRRequest(PydanticBaseModel):
     text: str  # Raw OCR text from your friends' service
 
-@app.post("/generate-memo", response_model=Memo)
-async def generate(request: OCRRequest):
+class BatchRequest(PydanticBaseModel):
+    texts: List[str]  # One OCR text per document
+
+# Memos are validated when generated, so they are serialised straight to JSON
+# instead of going through response_model validation again; `responses` keeps
+# the schema in the OpenAPI docs
+@app.post("/generate-memo", responses={200: {"model": Memo}})
+async def generate(request: OCRRequest) -> Response:
+    try:
+        memo = await generate_memo(request.text)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(memo.model_dump_json(), media_type="application/json")
+
+@app.post("/generate-memos-batch", responses={200: {"model": BatchMemoResponse}})
+async def generate_batch(request: BatchRequest) -> Response:
     try:
-        memo = generate_memo(request.text)
-        return memo
+        memos = await generate_memos(request.texts)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    batch = BatchMemoResponse.model_construct(memos=memos)
+    return Response(batch.model_dump_json(), media_type="application/json")
+
+@app.post("/generate-memo/stream")
+async def generate_stream(request: OCRRequest):
+    """Server-Sent Events: each event is the memo as generated so far"""
+    async def events():
+        try:
+            async for memo in stream_memo(request.text):
+                yield f"data: {memo.model_dump_json()}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # loop/http "auto" pick uvloop and httptools when installed (uvicorn[standard]).
+    # Workers are separate processes: the in-memory memo cache is per worker,
+    # the on-disk cache under MEMO_CACHE_DIR is shared.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    )
@@ -25,4 +25,8 @@ class Memo(BaseModel):
     """Credit memo structure"""
     executive_summary: List[str] = Field(..., max_items=5, description="3-5 bullets")
     key_metrics: List[Metric] = Field(default_factory=list)
-    top_risks: List[Risk] = Field(..., max_items=3)
\ No newline at end of file
+    top_risks: List[Risk] = Field(..., max_items=3)
+
+class BatchMemoResponse(BaseModel):
+    """One memo per input document, in input order"""
+    memos: List[Memo]
@@ -0,0 +1,72 @@
+"""Semantic memo cache: reuse a memo for OCR text that embeds close to a seen one.
+
+Requires numpy and sentence-transformers. Off by default, since near-identical
+text with different figures can match; enable with MEMO_SEMANTIC_CACHE=1.
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from models import Memo
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+class SemanticCache:
+    """LRU of memos indexed by L2-normalised text embeddings"""
+
+    def __init__(self, size: int = 1024, threshold: float = 0.87):
+        self.size = size
+        self.threshold = threshold
+        self._model = None
+        # Rows are normalised, so cosine similarity is a plain dot product.
+        # Unused rows stay zero and can never reach the threshold.
+        self._matrix: Optional[np.ndarray] = None
+        self._memos: List[Optional[Memo]] = [None] * size
+        self._rows: "OrderedDict[str, int]" = OrderedDict()  # cache key -> row, LRU order
+        self._row_keys: List[Optional[str]] = [None] * size
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        """Return the normalised float32 embedding of text"""
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(EMBEDDING_MODEL)
+            model = self._model
+        return model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def lookup(self, embedding: np.ndarray) -> Tuple[Optional[str], Optional[Memo]]:
+        """Return (key, memo) of the closest cached entry above threshold"""
+        with self._lock:
+            if not self._rows:
+                return None, None
+            scores = self._matrix @ embedding
+            row = int(np.argmax(scores))
+            if scores[row] < self.threshold:
+                return None, None
+            key = self._row_keys[row]
+            self._rows.move_to_end(key)
+            return key, self._memos[row]
+
+    def add(self, key: str, embedding: np.ndarray, memo: Memo) -> None:
+        """Insert memo under key, evicting the least recently used entry"""
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.size, embedding.shape[0]), dtype=np.float32)
+
+            if key in self._rows:
+                row = self._rows[key]
+                self._rows.move_to_end(key)
+            elif len(self._rows) < self.size:
+                row = len(self._rows)
+                self._rows[key] = row
+            else:
+                _, row = self._rows.popitem(last=False)
+                self._rows[key] = row
+
+            self._matrix[row] = embedding
+            self._memos[row] = memo
+            self._row_keys[row] = key
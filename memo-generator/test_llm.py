@@ -0,0 +1,167 @@
+"""Tests for the OCR text handling and memo cache tiers in llm.py"""
+import asyncio
+import time
+
+import llm
+from models import Confidence, Memo, Metric, Risk
+
+HEADER = "ACME Industries Limited - Annual Report 2024"
+FOOTER = "Confidential - for internal credit review only"
+
+
+def _doc(*bodies: str) -> str:
+    """Join page bodies with '--- PAGE N ---' markers"""
+    return "".join(f"--- PAGE {n} ---\n{body}\n" for n, body in enumerate(bodies, start=1))
+
+
+def _metric(name: str, period: str = "FY2024") -> Metric:
+    return Metric(
+        name=name, value="100", period=period, source_pages=[1], confidence=Confidence.STRONG
+    )
+
+
+def _risk(title: str, severity: str) -> Risk:
+    return Risk(
+        title=title, description="-", severity=severity, source_pages=[1],
+        confidence=Confidence.STRONG,
+    )
+
+
+def test_split_pages():
+    assert llm._split_pages(_doc("a", "b")) == ["--- PAGE 1 ---\na\n", "--- PAGE 2 ---\nb\n"]
+
+
+def test_split_pages_keeps_preamble_with_first_page():
+    text = "Cover note\n" + _doc("a", "b")
+    assert llm._split_pages(text) == [
+        "Cover note\n--- PAGE 1 ---\na\n",
+        "--- PAGE 2 ---\nb\n",
+    ]
+
+
+def test_split_pages_without_markers():
+    assert llm._split_pages("plain text") == ["plain text"]
+
+
+def test_split_by_page_markers():
+    text = _doc(*"abcde")
+    assert llm._split_by_page_markers(text, pages_per_chunk=5) == [text]
+
+    chunks = llm._split_by_page_markers(text, pages_per_chunk=2)
+    assert len(chunks) == 3
+    assert "".join(chunks) == text
+    assert chunks[2] == "--- PAGE 5 ---\ne\n"
+
+
+def test_preprocess_keeps_labels_repeated_across_pages():
+    # Table labels recur in every page body; only the running header and
+    # footer are boilerplate
+    text = _doc(*(
+        f"{HEADER}\n"
+        f"Standalone results, quarter {quarter}\n"
+        "Revenue from operations\n"
+        f"{quarter}50.0\n"
+        "Total current liabilities\n"
+        f"{quarter}20.0\n"
+        "Revenue from operations\n"
+        f"{FOOTER}"
+        for quarter in (1, 2, 3)
+    ))
+    result = llm._preprocess(text)
+
+    assert HEADER not in result
+    assert FOOTER not in result
+    for quarter in (1, 2, 3):
+        page = result.split(f"--- PAGE {quarter} ---\n")[1].split("--- PAGE")[0]
+        assert page.count("Revenue from operations") == 2
+        assert "Total current liabilities" in page
+
+
+def test_preprocess_needs_repeats_on_enough_pages():
+    # Two pages can't establish a running header
+    assert HEADER in llm._preprocess(_doc(f"{HEADER}\nRevenue 10", f"{HEADER}\nRevenue 20"))
+
+    # Six pages need the line on half of them
+    bodies = [f"{HEADER}\nRevenue {n}" if n < 2 else f"Revenue {n}" for n in range(6)]
+    assert HEADER in llm._preprocess(_doc(*bodies))
+    bodies = [f"{HEADER}\nRevenue {n}" if n < 3 else f"Revenue {n}" for n in range(6)]
+    assert HEADER not in llm._preprocess(_doc(*bodies))
+
+
+def test_preprocess_only_strips_page_edges():
+    # The same line mid-page is content even when it is a header elsewhere
+    bodies = [f"{HEADER}\nRevenue\n{n}\nEBITDA\n{n}" for n in range(3)]
+    bodies.append(f"Revenue\n3\n{HEADER}\nEBITDA\n3")
+    result = llm._preprocess(_doc(*bodies))
+    assert result.count(HEADER) == 1
+
+
+def test_preprocess_squeezes_whitespace():
+    assert llm._preprocess("Revenue  \t 150 Cr\n\n\n  EBITDA 30\n") == "Revenue 150 Cr\nEBITDA 30"
+
+
+def test_preprocess_keeps_most_financial_pages_in_order(monkeypatch):
+    monkeypatch.setattr(llm, "MAX_PAGES", 2)
+    text = _doc("Notice of meeting", "Revenue 1500 EBITDA 300", "Agenda", "Debt 9000")
+    result = llm._preprocess(text)
+    assert result == "--- PAGE 2 ---\nRevenue 1500 EBITDA 300\n--- PAGE 4 ---\nDebt 9000"
+
+
+def test_merge_memos():
+    first = Memo(
+        executive_summary=["A1", "A2", "Shared"],
+        key_metrics=[_metric("Revenue"), _metric("EBITDA")],
+        top_risks=[_risk("Liquidity", "low"), _risk("Leverage", "medium")],
+    )
+    second = Memo(
+        executive_summary=["B1", "Shared", "B3", "B4"],
+        key_metrics=[_metric("revenue"), _metric("Revenue", period="FY2023")],
+        top_risks=[_risk("leverage", "high"), _risk("Concentration", "high")],
+    )
+    merged = llm._merge_memos([first, second])
+
+    # Bullets interleave across chunks, without duplicates, capped at five
+    assert merged.executive_summary == ["A1", "B1", "A2", "Shared", "B3"]
+    # Metrics dedupe on (name, period), case-insensitively; first one wins
+    assert [(m.name, m.period) for m in merged.key_metrics] == [
+        ("Revenue", "FY2024"), ("EBITDA", "FY2024"), ("Revenue", "FY2023"),
+    ]
+    # Risks dedupe on title and are ordered by severity, capped at three
+    assert [(r.title, r.severity) for r in merged.top_risks] == [
+        ("Concentration", "high"), ("Leverage", "medium"), ("Liquidity", "low"),
+    ]
+
+
+def _cache_get(key: str):
+    """Run llm._cache_get on a fresh event loop, closing clients afterwards"""
+    async def lookup():
+        try:
+            return await llm._cache_get(key)
+        finally:
+            await llm.aclose()
+    return asyncio.run(lookup())
+
+
+def test_cache_disk_hit_skips_redis(monkeypatch, tmp_path):
+    def no_redis():
+        raise AssertionError("Redis consulted for a disk hit")
+
+    monkeypatch.setattr(llm, "MEMO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(llm, "REDIS_URL", "redis://localhost:6379/0")
+    monkeypatch.setattr(llm, "_get_redis", no_redis)
+    memo = Memo(executive_summary=["Cached"], top_risks=[])
+    llm._store_cached_memo("disk-hit", memo)
+    llm._memory_cache.clear()
+
+    assert _cache_get("disk-hit") == memo
+
+
+def test_cache_unreachable_redis_is_a_quick_miss(monkeypatch, tmp_path):
+    # A non-routable address: without timeouts the connect would hang
+    monkeypatch.setattr(llm, "MEMO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(llm, "REDIS_URL", "redis://10.255.255.1:6379/0")
+    monkeypatch.setattr(llm, "REDIS_TIMEOUT", 0.2)
+
+    start = time.monotonic()
+    assert _cache_get("missing") is None
+    assert time.monotonic() - start < 2
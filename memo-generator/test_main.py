@@ -0,0 +1,247 @@
+"""API tests with the Groq HTTP API replaced by a mocked transport"""
+import json
+import re
+
+import groq
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import llm
+import main
+
+MEMO = {
+    "executive_summary": ["Revenue grew 12%", "Margins stable", "Low leverage"],
+    "key_metrics": [],
+    "top_risks": [],
+}
+OCR_TEXT = "Revenue from operations 150 Cr\nEBITDA 30 Cr"
+
+
+def _sse_chunks(content: str, size: int = 16) -> bytes:
+    """Encode content as an OpenAI-style chat.completion.chunk SSE stream"""
+    events = []
+    for start in range(0, len(content), size):
+        chunk = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "llama-3.1-8b-instant",
+            "choices": [{
+                "index": 0,
+                "delta": {"content": content[start:start + size]},
+                "finish_reason": None,
+            }],
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode("utf-8")
+
+
+def _memo_for(document: str) -> dict:
+    """Memo the mock returns for one document, tagged with its first line"""
+    return {"executive_summary": [document.strip().splitlines()[0]], "top_risks": []}
+
+
+class MockGroqAPI:
+    """Answers chat completions like Groq and records every request body
+
+    Streaming requests get MEMO; others get a memo per document tagged with the
+    document's first line, so tests can check which text produced which memo.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.drop_batch_memo = False  # answer batches with one memo too few
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                content=_sse_chunks(json.dumps(MEMO)),
+                headers={"content-type": "text/event-stream"},
+            )
+
+        user = body["messages"][-1]["content"]
+        if user.startswith(llm._BATCH_USER_PREFIX):
+            documents = re.split(r"=== DOCUMENT \d+ ===\n", user)[1:]
+            memos = [_memo_for(document) for document in documents]
+            if self.drop_batch_memo:
+                memos.pop()
+            content = {"memos": memos}
+        else:
+            content = _memo_for(user[len(llm._USER_PREFIX):])
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(content)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    def batch_requests(self):
+        return [body for body in self.requests
+                if body["messages"][-1]["content"].startswith(llm._BATCH_USER_PREFIX)]
+
+
+@pytest.fixture
+def groq_api(monkeypatch, tmp_path):
+    """Route Groq calls to a MockGroqAPI with caches isolated per test"""
+    api = MockGroqAPI()
+
+    class MockAsyncGroq(groq.AsyncGroq):
+        def __init__(self, **kwargs):
+            transport = httpx.MockTransport(api.handler)
+            super().__init__(http_client=httpx.AsyncClient(transport=transport), **kwargs)
+
+    monkeypatch.setattr(groq, "AsyncGroq", MockAsyncGroq)
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    monkeypatch.setattr(llm, "MEMO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(llm, "REDIS_URL", None)
+    monkeypatch.setattr(llm, "SEMANTIC_CACHE_ENABLED", False)
+    llm._memory_cache.clear()
+    yield api
+    llm._memory_cache.clear()
+
+
+def _parse_sse(body: str):
+    """Split an SSE body into (event, data) pairs"""
+    events = []
+    for block in body.split("\n\n"):
+        if not block:
+            continue
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+def test_stream_memo_sse(groq_api):
+    # Entering the client runs the lifespan, so leaving it flushes cache writes
+    with TestClient(main.app) as client:
+        response = client.post("/generate-memo/stream", json={"text": OCR_TEXT})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.endswith("\n\n")
+
+    events = _parse_sse(response.text)
+    assert len(events) > 1
+    assert all(event == "message" for event, _ in events)
+    assert events[-1][1] == MEMO
+
+    # Groq does not support JSON mode together with streaming
+    assert len(groq_api.requests) == 1
+    assert groq_api.requests[0]["stream"] is True
+    assert "response_format" not in groq_api.requests[0]
+
+
+def test_stream_memo_caches_final_memo(groq_api):
+    with TestClient(main.app) as client:
+        client.post("/generate-memo/stream", json={"text": OCR_TEXT})
+
+    # The memo must have reached the disk tier, not just the in-memory LRU
+    llm._memory_cache.clear()
+    cached = llm._load_cached_memo(llm._cache_key(llm._preprocess(OCR_TEXT)))
+    assert cached is not None
+    assert cached.model_dump() == MEMO
+
+    # A repeat request is served from the cache as a single event
+    with TestClient(main.app) as client:
+        response = client.post("/generate-memo/stream", json={"text": OCR_TEXT})
+    assert _parse_sse(response.text) == [("message", MEMO)]
+    assert len(groq_api.requests) == 1
+
+
+def _document(n: int) -> str:
+    return f"Document {n}\nRevenue {n}00 Cr"
+
+
+def _post_batch(texts):
+    """POST texts to the batch endpoint; return each memo's tag, in order"""
+    with TestClient(main.app) as client:
+        response = client.post("/generate-memos-batch", json={"texts": texts})
+    assert response.status_code == 200
+    return [memo["executive_summary"][0] for memo in response.json()["memos"]]
+
+
+def _documents_per_batch(api):
+    return sorted(
+        body["messages"][-1]["content"].count("=== DOCUMENT ") for body in api.batch_requests()
+    )
+
+
+def test_generate_memo(groq_api):
+    with TestClient(main.app) as client:
+        response = client.post("/generate-memo", json={"text": OCR_TEXT})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "executive_summary": ["Revenue from operations 150 Cr"],
+        "key_metrics": [],
+        "top_risks": [],
+    }
+    assert groq_api.requests[0]["response_format"] == {"type": "json_object"}
+
+
+def test_batch_packs_short_documents_in_order(groq_api):
+    assert _post_batch([_document(n) for n in range(3)]) == [
+        "Document 0", "Document 1", "Document 2",
+    ]
+    assert len(groq_api.requests) == 1
+    assert _documents_per_batch(groq_api) == [3]
+    # Room for a full memo per document
+    assert groq_api.requests[0]["max_tokens"] == 3 * llm.MAX_TOKENS
+
+
+def test_batch_respects_size_and_character_budgets(groq_api, monkeypatch):
+    monkeypatch.setattr(llm, "BATCH_DOC_MAX_CHARS", 100)
+    monkeypatch.setattr(llm, "BATCH_MAX_CHARS", 2 * len(_document(0)))
+    long_text = "Long document\n" + "Revenue 1 Cr. " * 20
+    texts = [_document(0), long_text, _document(2), _document(3), _document(4)]
+
+    assert _post_batch(texts) == [
+        "Document 0", "Long document", "Document 2", "Document 3", "Document 4",
+    ]
+    # Two per batch fit the character budget; the long one goes on its own
+    assert _documents_per_batch(groq_api) == [2, 2]
+    singles = [body for body in groq_api.requests if body not in groq_api.batch_requests()]
+    assert len(singles) == 1
+    assert singles[0]["messages"][-1]["content"].startswith(llm._USER_PREFIX + "Long document")
+
+
+def test_batch_never_packs_documents_over_budget(groq_api):
+    # Unmarked text is one "page" however long it is; size alone must decide
+    texts = [f"Document {n}\n" + "x" * llm.BATCH_DOC_MAX_CHARS for n in range(5)]
+
+    assert _post_batch(texts) == [f"Document {n}" for n in range(5)]
+    assert groq_api.batch_requests() == []
+    assert len(groq_api.requests) == 5
+
+
+def test_batch_skips_cached_documents(groq_api):
+    with TestClient(main.app) as client:
+        client.post("/generate-memo", json={"text": _document(1)})
+
+    assert _post_batch([_document(n) for n in range(3)]) == [
+        "Document 0", "Document 1", "Document 2",
+    ]
+    assert len(groq_api.requests) == 2
+    assert _documents_per_batch(groq_api) == [2]
+
+
+def test_batch_falls_back_when_memo_count_mismatches(groq_api):
+    groq_api.drop_batch_memo = True
+
+    assert _post_batch([_document(n) for n in range(3)]) == [
+        "Document 0", "Document 1", "Document 2",
+    ]
+    # One batch call, then one call per document
+    assert _documents_per_batch(groq_api) == [3]
+    assert len(groq_api.requests) == 4
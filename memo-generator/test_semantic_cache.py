@@ -0,0 +1,67 @@
+"""Tests for SemanticCache's LRU and threshold logic, using hand-made embeddings"""
+import numpy as np
+
+from models import Memo
+from semantic_cache import SemanticCache
+
+E1, E2, E3 = np.eye(3, dtype=np.float32)
+
+
+def _memo(name: str) -> Memo:
+    return Memo(executive_summary=[name], top_risks=[])
+
+
+def _filled_cache() -> SemanticCache:
+    cache = SemanticCache(size=2, threshold=0.9)
+    cache.add("k1", E1, _memo("m1"))
+    cache.add("k2", E2, _memo("m2"))
+    return cache
+
+
+def test_eviction_reuses_oldest_row():
+    cache = _filled_cache()
+    row = cache._rows["k1"]
+
+    cache.add("k3", E3, _memo("m3"))
+
+    assert "k1" not in cache._rows
+    assert cache._rows["k3"] == row
+    assert cache.lookup(E1) == (None, None)
+    assert cache.lookup(E3)[0] == "k3"
+    assert cache.lookup(E2)[0] == "k2"
+
+
+def test_lookup_refreshes_recency():
+    cache = _filled_cache()
+    key, memo = cache.lookup(E1)
+    assert key == "k1"
+    assert memo.executive_summary == ["m1"]
+
+    # k2 is now the least recently used entry
+    cache.add("k3", E3, _memo("m3"))
+
+    assert cache.lookup(E2) == (None, None)
+    assert cache.lookup(E1)[0] == "k1"
+
+
+def test_readding_a_key_updates_it_in_place():
+    cache = _filled_cache()
+    row = cache._rows["k1"]
+
+    cache.add("k1", E3, _memo("m1b"))
+
+    assert cache._rows["k1"] == row
+    assert cache.lookup(E1) == (None, None)
+    assert cache.lookup(E3)[1].executive_summary == ["m1b"]
+
+
+def test_lookup_below_threshold_misses():
+    cache = SemanticCache(size=2, threshold=0.9)
+    assert cache.lookup(E1) == (None, None)
+
+    cache.add("k1", E1, _memo("m1"))
+
+    near = np.array([0.95, np.sqrt(1 - 0.95 ** 2), 0], dtype=np.float32)
+    far = np.array([0.8, 0.6, 0], dtype=np.float32)
+    assert cache.lookup(near)[0] == "k1"
+    assert cache.lookup(far) == (None, None)
@@ -0,0 +1,40 @@
+"""Tests for batch_processor.py on small PDFs generated with pypdfium2"""
+import ctypes
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+
+from batch_processor import _process_one
+
+
+def _write_pdf(path, text):
+    """Write a one-page PDF containing text"""
+    pdf = pdfium.PdfDocument.new()
+    page = pdf.new_page(612, 792)
+    text_obj = pdfium_c.FPDFPageObj_NewTextObj(pdf.raw, b"Helvetica", 12.0)
+    buffer = ctypes.create_string_buffer((text + "\0").encode("utf-16-le"))
+    pdfium_c.FPDFText_SetText(text_obj, ctypes.cast(buffer, ctypes.POINTER(pdfium_c.FPDF_WCHAR)))
+    pdfium_c.FPDFPageObj_Transform(text_obj, 1, 0, 0, 1, 72, 720)
+    pdfium_c.FPDFPage_InsertObject(page.raw, text_obj)
+    pdfium_c.FPDFPage_GenerateContent(page.raw)
+    pdf.save(str(path))
+    page.close()
+    pdf.close()
+
+
+def test_output_file_is_named_from_stem(tmp_path):
+    # An upper-case extension and a '.pdf' directory must not change where
+    # the text goes, nor overwrite the source PDF
+    pdf_dir = tmp_path / "dir.pdf"
+    pdf_dir.mkdir()
+    pdf_path = pdf_dir / "report.PDF"
+    _write_pdf(pdf_path, "Revenue 150 Cr")
+    original = pdf_path.read_bytes()
+
+    result = _process_one(str(pdf_path), save_individual_files=True)
+
+    assert result['success']
+    assert result['output_file'] == str(pdf_dir / "report_extracted.txt")
+    assert "Revenue 150 Cr" in (pdf_dir / "report_extracted.txt").read_text(encoding='utf-8')
+    assert pdf_path.read_bytes() == original
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dir.pdf"]